@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the Exercise Timer API
+Measures module import, app startup (ASGI lifespan) and first-request latency
+in fresh interpreters
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+
+# Runs inside a fresh interpreter so that nothing is already imported. The app
+# is configured like a uvicorn worker with the default environment (session
+# sweeper on) and goes through the ASGI lifespan around the first request.
+PROBE = r'''
+import asyncio, json, sys, time
+
+t0 = time.perf_counter()
+import server
+t1 = time.perf_counter()
+motor_at_import = "motor" in sys.modules
+
+app = server.create_app(server.AppConfig(
+    mongo_url=sys.argv[1] or None,
+    db_name=sys.argv[2] or None,
+    sweep_sessions=True,
+    watch_changes=sys.argv[4] == "1",
+))
+t2 = time.perf_counter()
+
+
+def lifespan():
+    """Run the app's lifespan, returning a function that sends it the next event"""
+    queue = asyncio.Queue()
+    replies = asyncio.Queue()
+
+    async def send(message):
+        await replies.put(message["type"])
+
+    task = asyncio.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}}, queue.get, send))
+
+    async def step(event):
+        await queue.put({"type": f"lifespan.{event}"})
+        reply = await replies.get()
+        if reply != f"lifespan.{event}.complete":
+            raise RuntimeError(f"lifespan {event} failed: {reply}")
+        if event == "shutdown":
+            await task
+
+    return step
+
+
+async def request(path):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+    }
+    sent = False
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def main():
+    step = lifespan()
+    await step("startup")
+    t3 = time.perf_counter()
+    motor_after_startup = "motor" in sys.modules
+    status = await request(sys.argv[3])
+    t4 = time.perf_counter()
+    motor_after_request = "motor" in sys.modules
+    await step("shutdown")
+    return {
+        "import_ms": (t1 - t0) * 1000,
+        "create_app_ms": (t2 - t1) * 1000,
+        "startup_ms": (t3 - t2) * 1000,
+        "first_request_ms": (t4 - t3) * 1000,
+        "status": status,
+        "motor_at_import": motor_at_import,
+        "motor_after_startup": motor_after_startup,
+        "motor_after_request": motor_after_request,
+    }
+
+
+print(json.dumps(asyncio.run(main())))
+'''
+
+
+def run_once(mongo_url: str, db_name: str, path: str, watch_changes: bool) -> dict:
+    probe = subprocess.run(
+        [sys.executable, "-c", PROBE, mongo_url, db_name, path, "1" if watch_changes else "0"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if probe.returncode != 0:
+        error = probe.stderr.strip().splitlines()
+        sys.exit(f"probe failed: {error[-1] if error else probe.returncode}")
+    return json.loads(probe.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import, startup and first-request latency")
+    parser.add_argument("--runs", type=int, default=10, help="number of fresh interpreters to start")
+    parser.add_argument("--path", help="path of the first request (default: /api/exercises with --mongo-url, else /api/)")
+    parser.add_argument("--mongo-url", default="", help="MongoDB URL for DB routes")
+    parser.add_argument("--db-name", default="", help="database name for DB routes")
+    parser.add_argument("--watch-changes", action="store_true", help="start the change stream watcher (needs a replica set)")
+    args = parser.parse_args()
+    if args.path is None:
+        args.path = "/api/exercises" if args.mongo_url else "/api/"
+    if args.path == "/api/" and not args.mongo_url:
+        print("note: without --mongo-url the first request does not touch the database,")
+        print("      so lazy client construction and the motor import are not measured")
+
+    results = [run_once(args.mongo_url, args.db_name, args.path, args.watch_changes) for _ in range(args.runs)]
+
+    print("=" * 60)
+    print(f"STARTUP BENCHMARK: {args.runs} runs, first request GET {args.path}")
+    print("=" * 60)
+    for key in ("import_ms", "create_app_ms", "startup_ms", "first_request_ms"):
+        values = sorted(r[key] for r in results)
+        print(f"{key:<18} median {statistics.median(values):8.2f}   min {values[0]:8.2f}   max {values[-1]:8.2f}")
+    print(f"status codes: {sorted({r['status'] for r in results})}")
+    print(f"motor loaded by import: {any(r['motor_at_import'] for r in results)}, "
+          f"by startup: {any(r['motor_after_startup'] for r in results)}, "
+          f"after first request: {all(r['motor_after_request'] for r in results)}")
+
+
+if __name__ == "__main__":
+    main()
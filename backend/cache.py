@@ -0,0 +1,142 @@
+"""
+Per-worker cache for exercises and workout settings, kept coherent across
+uvicorn workers by a MongoDB change stream.
+
+Every worker runs its own ChangeStreamWatcher, so a write handled by any worker
+invalidates the cached entries in all of them. The cache only serves while the
+stream is open: it is switched off and emptied whenever the stream is down,
+and a new stream starts from the current time on an empty cache. There is
+nothing to resume, since the cache lives in the worker's memory and an empty
+cache has missed no events. Resumable errors within one stream are retried
+by the driver itself.
+
+Change streams need a replica set. For local testing a single node is enough:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0
+    mongosh --eval 'rs.initiate()'
+    MONGO_URL='mongodb://localhost:27017/?replicaSet=rs0' WATCH_CHANGES=1 uvicorn server:app --workers 2
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ["exercises", "workout_settings"]
+
+# "$changeStream stage is only supported on replica sets"
+CHANGE_STREAM_NOT_SUPPORTED = 40573
+
+
+class LocalCache:
+    """In-process cache grouped by namespace.
+
+    Each namespace carries a version that is bumped on invalidation, and the
+    whole cache an epoch bumped on clear/enable; ``set`` drops values read
+    before the latest of either so a slow read can not put stale data back
+    into the cache.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._data: Dict[str, Dict[Any, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        self._epoch = 0
+
+    def version(self, namespace: str) -> Tuple[int, int]:
+        return self._epoch, self._versions.get(namespace, 0)
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        return self._data.get(namespace, {}).get(key)
+
+    def set(self, namespace: str, key: Any, value: Any, version: Tuple[int, int]):
+        if not self.enabled or version != self.version(namespace):
+            return
+        self._data.setdefault(namespace, {})[key] = value
+
+    def invalidate(self, namespace: str, key: Any = None):
+        """Drop one key, or the whole namespace when no key is given"""
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+        if key is None:
+            self._data.pop(namespace, None)
+        else:
+            self._data.get(namespace, {}).pop(key, None)
+
+    def enable(self):
+        """Start serving; reads that began while disabled are not stored"""
+        self.clear()
+        self.enabled = True
+
+    def disable(self):
+        """Stop serving and drop everything cached"""
+        self.enabled = False
+        self.clear()
+
+    def clear(self):
+        self._epoch += 1
+        self._data.clear()
+
+
+class ChangeStreamWatcher:
+    """Applies change stream events on the watched collections to a LocalCache"""
+
+    def __init__(self, db, cache: LocalCache, retry_delay: float = 5.0):
+        self.db = db
+        self.cache = cache
+        self.retry_delay = retry_delay
+
+    def apply(self, change: dict):
+        """Invalidate the cache entries touched by a single change event"""
+        operation = change.get("operationType")
+        collection = change.get("ns", {}).get("coll")
+
+        if operation in ("dropDatabase", "invalidate"):
+            self.cache.clear()
+        elif collection == "exercises":
+            self.cache.invalidate("exercises")
+        elif collection == "workout_settings":
+            document = change.get("fullDocument") or {}
+            if operation in ("insert", "update", "replace") and "userId" in document:
+                self.cache.invalidate("settings", document["userId"])
+            else:
+                # Deletes and drops only carry the _id, so drop every user's settings
+                self.cache.invalidate("settings")
+
+    async def run(self):
+        from pymongo.errors import OperationFailure, PyMongoError
+
+        pipeline = [{"$match": {"$or": [
+            {"ns.coll": {"$in": WATCHED_COLLECTIONS}},
+            {"operationType": {"$in": ["dropDatabase", "invalidate"]}}
+        ]}}]
+
+        try:
+            while True:
+                try:
+                    async with self.db.watch(pipeline, full_document="updateLookup") as stream:
+                        # The stream is open, so from here on every write reaches the cache
+                        self.cache.enable()
+                        logger.info("Watching %s for cache invalidation", ", ".join(WATCHED_COLLECTIONS))
+                        async for change in stream:
+                            self.apply(change)
+                            if change.get("operationType") in ("dropDatabase", "invalidate"):
+                                break
+                except OperationFailure as e:
+                    self.cache.disable()
+                    if e.code == CHANGE_STREAM_NOT_SUPPORTED:
+                        logger.error("Change streams need a replica set; caching stays disabled: %s", e)
+                        return
+                    logger.warning("Change stream failed, retrying: %s", e)
+                    await asyncio.sleep(self.retry_delay)
+                except PyMongoError as e:
+                    self.cache.disable()
+                    logger.warning("Change stream interrupted, retrying: %s", e)
+                    await asyncio.sleep(self.retry_delay)
+                else:
+                    # The stream ended (e.g. after an invalidate), reopen it on an empty cache
+                    self.cache.disable()
+        finally:
+            self.cache.disable()
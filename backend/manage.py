@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Maintenance commands for the Exercise Timer backend
+
+    python manage.py ensure-indexes      # create the indexes the API relies on (run on deploy)
+    python manage.py migrate-storage     # rewrite legacy documents in compact form
+    python manage.py size-report         # compare legacy and compact storage on seeded data
+"""
+
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import typer
+from pymongo import ReplaceOne
+
+from server import AppConfig, Database, Exercise, WorkoutSession, WorkoutSettings
+from storage import ID_PATHS, INDEXES, CompactCodec, DocumentCodec, ensure_indexes
+
+cli = typer.Typer(help="Exercise Timer maintenance commands")
+
+
+def connect() -> Database:
+    database = Database(AppConfig.from_env())
+    database.get()
+    return database
+
+
+async def migrate_collection(db, collection: str, batch_size: int) -> dict:
+    """Move legacy documents of one collection to the compact shape, batch by batch.
+
+    Each batch is written with upserting replaces under the new ``_id`` before
+    the originals are deleted. An interrupted run can simply be started again:
+    a compact copy left behind by it is overwritten with the current legacy
+    content, so updates made in between are kept.
+
+    A public id stored more than once cannot be migrated without losing one of
+    the documents. Only its first copy is migrated; the others are left in the
+    legacy shape and their ``_id`` values returned for manual cleanup.
+    """
+    codec = CompactCodec()
+    migrated = 0
+    written, duplicates = set(), []
+    while True:
+        legacy_docs = await db[collection].find(
+            {"id": {"$exists": True}, "_id": {"$nin": duplicates}}
+        ).limit(batch_size).to_list(batch_size)
+        if not legacy_docs:
+            break
+        moved, replacements = [], []
+        for doc in legacy_docs:
+            compact_doc = codec.dump(collection, {k: v for k, v in doc.items() if k != "_id"})
+            if compact_doc["_id"] in written:
+                duplicates.append(doc["_id"])
+                continue
+            written.add(compact_doc["_id"])
+            moved.append(doc["_id"])
+            replacements.append(ReplaceOne({"_id": compact_doc["_id"]}, compact_doc, upsert=True))
+        if replacements:
+            await db[collection].bulk_write(replacements, ordered=False)
+            await db[collection].delete_many({"_id": {"$in": moved}})
+        migrated += len(moved)
+    return {"migrated": migrated, "duplicates": duplicates}
+
+
+@cli.command("migrate-storage")
+def migrate_storage(batch_size: int = typer.Option(500, help="documents moved per batch")):
+    """Rewrite legacy documents in the compact storage shape.
+
+    Reads work in either storage mode while this runs, but updates and deletes
+    by id only find documents in the configured shape and return 404 for the
+    rest. Run it in a maintenance window, or accept those 404s until it has
+    finished and every worker has restarted with STORAGE_MODE=compact.
+    """
+
+    async def run():
+        database = connect()
+        db = database.get()
+        try:
+            for collection in ID_PATHS:
+                result = await migrate_collection(db, collection, batch_size)
+                typer.echo(f"{collection}: migrated {result['migrated']} documents")
+                for legacy_id in result["duplicates"]:
+                    typer.echo(f"  duplicate id left in legacy form: _id {legacy_id}", err=True)
+            await ensure_indexes(db)
+        finally:
+            database.close()
+
+    asyncio.run(run())
+
+
+@cli.command("ensure-indexes")
+def create_indexes():
+    """Create the secondary indexes the API and the session sweeper rely on.
+
+    Workers do not create indexes at startup; run this on every deploy.
+    Creating an index that already exists is a no-op.
+    """
+
+    async def run():
+        database = connect()
+        try:
+            await ensure_indexes(database.get())
+        finally:
+            database.close()
+        typer.echo(f"ensured {len(INDEXES)} indexes")
+
+    asyncio.run(run())
+
+
+def seed_documents(users: int, sessions_per_user: int) -> dict:
+    """Build a deterministic dataset in the public JSON shape"""
+    rng = random.Random(42)
+    exercises = [
+        Exercise(name=name, description=f"{name} exercise")
+        for name in ("Push-ups", "Squats", "Jumping Jacks", "Mountain Climbers", "Burpees", "Lunges")
+    ]
+    exercise_ids = [exercise.id for exercise in exercises]
+    settings, sessions = [], []
+    for user in range(users):
+        user_settings = WorkoutSettings(userId=f"user-{user}", exerciseOrder=rng.sample(exercise_ids, len(exercise_ids)))
+        settings.append(user_settings)
+        for n in range(sessions_per_user):
+            started_at = datetime(2026, 1, 1) + timedelta(hours=rng.randrange(24 * 300))
+            sessions.append(WorkoutSession(
+                userId=user_settings.userId,
+                exercises=rng.sample(exercises, 4),
+                settings=user_settings,
+                startedAt=started_at,
+                completedAt=started_at + timedelta(minutes=20),
+                totalDuration=1200,
+                completedSets=12,
+                completedCircuits=2,
+                status="completed"
+            ))
+    return {
+        "exercises": [exercise.dict() for exercise in exercises],
+        "workout_settings": [item.dict() for item in settings],
+        "workout_sessions": [session.dict() for session in sessions],
+    }
+
+
+async def storage_stats(db, collection: str) -> dict:
+    stats = await db[collection].aggregate([{"$collStats": {"storageStats": {}}}]).to_list(1)
+    storage = stats[0]["storageStats"]
+    return {
+        "count": storage["count"],
+        "size": storage["size"],
+        "avgObjSize": storage.get("avgObjSize", 0),
+        "indexSize": storage["totalIndexSize"],
+    }
+
+
+@cli.command("size-report")
+def size_report(
+    users: int = typer.Option(200, help="seeded users"),
+    sessions_per_user: int = typer.Option(25, help="seeded sessions per user"),
+    keep: bool = typer.Option(False, help="keep the scratch databases"),
+):
+    """Seed the same dataset in both storage modes and compare document and index sizes"""
+
+    async def run():
+        database = connect()
+        client, base_name = database.client, database.config.db_name
+        documents = seed_documents(users, sessions_per_user)
+        results = {}
+        try:
+            for mode, codec in (("legacy", DocumentCodec()), ("compact", CompactCodec())):
+                db = client[f"{base_name}_size_{mode}"]
+                await client.drop_database(db.name)
+                # Only the indexes the app creates; the modes differ in their _id index
+                await ensure_indexes(db)
+                for collection, docs in documents.items():
+                    await db[collection].insert_many([codec.dump(collection, doc) for doc in docs])
+                results[mode] = {collection: await storage_stats(db, collection) for collection in documents}
+        finally:
+            if not keep:
+                for mode in results:
+                    await client.drop_database(f"{base_name}_size_{mode}")
+            database.close()
+
+        typer.echo("=" * 78)
+        typer.echo(f"STORAGE SIZE REPORT: {users} users, {sessions_per_user} sessions each")
+        typer.echo("=" * 78)
+        typer.echo(f"{'collection':<18}{'mode':<9}{'docs':>8}{'avg doc':>10}{'data':>12}{'indexes':>12}")
+        totals = {mode: [0, 0] for mode in results}
+        for collection in documents:
+            for mode in results:
+                stats = results[mode][collection]
+                totals[mode][0] += stats["size"]
+                totals[mode][1] += stats["indexSize"]
+                typer.echo(f"{collection:<18}{mode:<9}{stats['count']:>8}{stats['avgObjSize']:>10}"
+                           f"{stats['size']:>12}{stats['indexSize']:>12}")
+        typer.echo("-" * 78)
+        (legacy_data, legacy_index), (compact_data, compact_index) = totals["legacy"], totals["compact"]
+        typer.echo(f"data:    {legacy_data} -> {compact_data} bytes ({1 - compact_data / legacy_data:.1%} smaller)")
+        typer.echo(f"indexes: {legacy_index} -> {compact_index} bytes ({1 - compact_index / legacy_index:.1%} smaller)")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    cli()
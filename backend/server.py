@@ -1,26 +1,101 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
+import asyncio
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Callable, List, Literal, Optional
 import uuid
 from datetime import datetime
 
+from cache import ChangeStreamWatcher, LocalCache
+from storage import DocumentCodec, codec_for_mode
+from sweeper import SessionSweeper, get_metrics
+
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
 
-# Create the main app without a prefix
-app = FastAPI()
+# App configuration
+class AppConfig(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    mongo_url: Optional[str] = None
+    db_name: Optional[str] = None
+    db: Optional[Any] = None  # Pre-built database handle, e.g. injected by tests
+    storage_mode: Literal["legacy", "compact"] = "legacy"  # "compact" stores ids as binary UUIDs
+    watch_changes: bool = False  # Cache exercises/settings, invalidated via change streams
+    sweep_sessions: bool = False  # Periodically mark stale active sessions as abandoned
+    session_abandon_after: int = 4 * 60 * 60  # seconds a session may stay active
+    sweep_interval: float = 300  # seconds between sweeps
+    sweep_batch_size: int = 500
+    sweep_max_run_seconds: float = 10
+
+    @classmethod
+    def from_env(cls) -> "AppConfig":
+        """Build the config from the environment (and backend/.env if present)"""
+        from dotenv import load_dotenv
+
+        load_dotenv(ROOT_DIR / '.env')
+        return cls(
+            mongo_url=os.environ.get('MONGO_URL'),
+            db_name=os.environ.get('DB_NAME'),
+            storage_mode=os.environ.get('STORAGE_MODE', 'legacy'),
+            watch_changes=os.environ.get('WATCH_CHANGES', '').lower() in ('1', 'true', 'yes'),
+            sweep_sessions=os.environ.get('SWEEP_SESSIONS', '1').lower() in ('1', 'true', 'yes'),
+            session_abandon_after=int(os.environ.get('SESSION_ABANDON_AFTER', 4 * 60 * 60)),
+            sweep_interval=float(os.environ.get('SWEEP_INTERVAL', 300)),
+            sweep_batch_size=int(os.environ.get('SWEEP_BATCH_SIZE', 500)),
+            sweep_max_run_seconds=float(os.environ.get('SWEEP_MAX_RUN_SECONDS', 10)),
+        )
+
+
+class Database:
+    """Lazily constructs the MongoDB client on first use.
+
+    Importing motor and opening the client are deferred until the database is
+    first used: by a request, by the session sweeper's first run one interval
+    after startup, or at startup when the change stream watcher is enabled.
+    """
+
+    def __init__(self, config: AppConfig):
+        self.config = config
+        self.client = None
+        self._db = config.db
+
+    def get(self):
+        if self._db is None:
+            if not self.config.mongo_url or not self.config.db_name:
+                raise RuntimeError("MONGO_URL and DB_NAME must be configured")
+            from motor.motor_asyncio import AsyncIOMotorClient
+
+            self.client = AsyncIOMotorClient(self.config.mongo_url)
+            self._db = self.client[self.config.db_name]
+        return self._db
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+            self._db = self.config.db
+
+
+def get_db(request: Request):
+    """Dependency returning the database of the app serving the request"""
+    return request.app.state.database.get()
+
+
+def get_codec(request: Request) -> DocumentCodec:
+    """Dependency returning the codec between public and stored documents"""
+    return request.app.state.codec
+
+
+def get_cache(request: Request) -> LocalCache:
+    """Dependency returning the per-worker exercise/settings cache"""
+    return request.app.state.cache
+
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -103,22 +178,27 @@ async def root():
     return {"message": "Exercise Timer API", "version": "1.0.0"}
 
 @api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
+async def create_status_check(input: StatusCheckCreate, db=Depends(get_db), codec: DocumentCodec = Depends(get_codec)):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    _ = await db.status_checks.insert_one(codec.dump("status_checks", status_obj.dict()))
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
+async def get_status_checks(db=Depends(get_db), codec: DocumentCodec = Depends(get_codec)):
     status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+    return [StatusCheck(**codec.load("status_checks", status_check)) for status_check in status_checks]
 
 
 # Exercise Management Routes
 @api_router.get("/exercises", response_model=List[Exercise])
-async def get_exercises():
+async def get_exercises(db=Depends(get_db), codec: DocumentCodec = Depends(get_codec), cache: LocalCache = Depends(get_cache)):
     """Get all exercises"""
+    cached = cache.get("exercises", "all")
+    if cached is not None:
+        return cached
+
+    version = cache.version("exercises")
     exercises = await db.exercises.find().to_list(1000)
     if not exercises:
         # Initialize with default exercises if none exist
@@ -132,22 +212,26 @@ async def get_exercises():
         exercise_objects = []
         for ex_data in default_exercises:
             exercise = Exercise(**ex_data)
-            await db.exercises.insert_one(exercise.dict())
+            await db.exercises.insert_one(codec.dump("exercises", exercise.dict()))
             exercise_objects.append(exercise)
         
+        cache.set("exercises", "all", exercise_objects, version)
         return exercise_objects
     
-    return [Exercise(**exercise) for exercise in exercises]
+    exercise_objects = [Exercise(**codec.load("exercises", exercise)) for exercise in exercises]
+    cache.set("exercises", "all", exercise_objects, version)
+    return exercise_objects
 
 @api_router.post("/exercises", response_model=Exercise)
-async def create_exercise(exercise_data: ExerciseCreate):
+async def create_exercise(exercise_data: ExerciseCreate, db=Depends(get_db), codec: DocumentCodec = Depends(get_codec), cache: LocalCache = Depends(get_cache)):
     """Create a new exercise"""
     exercise = Exercise(**exercise_data.dict())
-    await db.exercises.insert_one(exercise.dict())
+    await db.exercises.insert_one(codec.dump("exercises", exercise.dict()))
+    cache.invalidate("exercises")
     return exercise
 
 @api_router.put("/exercises/{exercise_id}", response_model=Exercise)
-async def update_exercise(exercise_id: str, exercise_update: ExerciseUpdate):
+async def update_exercise(exercise_id: str, exercise_update: ExerciseUpdate, db=Depends(get_db), codec: DocumentCodec = Depends(get_codec), cache: LocalCache = Depends(get_cache)):
     """Update an existing exercise"""
     update_data = {k: v for k, v in exercise_update.dict().items() if v is not None}
     
@@ -155,20 +239,22 @@ async def update_exercise(exercise_id: str, exercise_update: ExerciseUpdate):
         raise HTTPException(status_code=400, detail="No update data provided")
     
     result = await db.exercises.update_one(
-        {"id": exercise_id},
+        codec.id_filter(exercise_id),
         {"$set": update_data}
     )
+    cache.invalidate("exercises")
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Exercise not found")
     
-    updated_exercise = await db.exercises.find_one({"id": exercise_id})
-    return Exercise(**updated_exercise)
+    updated_exercise = await db.exercises.find_one(codec.id_filter(exercise_id))
+    return Exercise(**codec.load("exercises", updated_exercise))
 
 @api_router.delete("/exercises/{exercise_id}")
-async def delete_exercise(exercise_id: str):
+async def delete_exercise(exercise_id: str, db=Depends(get_db), codec: DocumentCodec = Depends(get_codec), cache: LocalCache = Depends(get_cache)):
     """Delete an exercise"""
-    result = await db.exercises.delete_one({"id": exercise_id})
+    result = await db.exercises.delete_one(codec.id_filter(exercise_id))
+    cache.invalidate("exercises")
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Exercise not found")
@@ -178,20 +264,28 @@ async def delete_exercise(exercise_id: str):
 
 # Workout Settings Routes
 @api_router.get("/settings", response_model=WorkoutSettings)
-async def get_workout_settings(user_id: str = "default"):
+async def get_workout_settings(user_id: str = "default", db=Depends(get_db), codec: DocumentCodec = Depends(get_codec), cache: LocalCache = Depends(get_cache)):
     """Get workout settings for a user"""
+    cached = cache.get("settings", user_id)
+    if cached is not None:
+        return cached
+
+    version = cache.version("settings")
     settings = await db.workout_settings.find_one({"userId": user_id})
     
     if not settings:
         # Create default settings if none exist
         default_settings = WorkoutSettings(userId=user_id)
-        await db.workout_settings.insert_one(default_settings.dict())
+        await db.workout_settings.insert_one(codec.dump("workout_settings", default_settings.dict()))
+        cache.set("settings", user_id, default_settings, version)
         return default_settings
     
-    return WorkoutSettings(**settings)
+    settings = WorkoutSettings(**codec.load("workout_settings", settings))
+    cache.set("settings", user_id, settings, version)
+    return settings
 
 @api_router.post("/settings", response_model=WorkoutSettings)
-async def create_or_update_workout_settings(settings_data: WorkoutSettingsCreate):
+async def create_or_update_workout_settings(settings_data: WorkoutSettingsCreate, db=Depends(get_db), codec: DocumentCodec = Depends(get_codec), cache: LocalCache = Depends(get_cache)):
     """Create or update workout settings"""
     user_id = settings_data.userId or "default"
     
@@ -205,19 +299,21 @@ async def create_or_update_workout_settings(settings_data: WorkoutSettingsCreate
         
         await db.workout_settings.update_one(
             {"userId": user_id},
-            {"$set": update_data}
+            {"$set": codec.dump("workout_settings", update_data)}
         )
+        cache.invalidate("settings", user_id)
         
         updated_settings = await db.workout_settings.find_one({"userId": user_id})
-        return WorkoutSettings(**updated_settings)
+        return WorkoutSettings(**codec.load("workout_settings", updated_settings))
     else:
         # Create new settings
         settings = WorkoutSettings(**settings_data.dict())
-        await db.workout_settings.insert_one(settings.dict())
+        await db.workout_settings.insert_one(codec.dump("workout_settings", settings.dict()))
+        cache.invalidate("settings", user_id)
         return settings
 
 @api_router.put("/settings", response_model=WorkoutSettings)
-async def update_workout_settings(settings_update: WorkoutSettingsUpdate, user_id: str = "default"):
+async def update_workout_settings(settings_update: WorkoutSettingsUpdate, user_id: str = "default", db=Depends(get_db), codec: DocumentCodec = Depends(get_codec), cache: LocalCache = Depends(get_cache)):
     """Update workout settings"""
     update_data = {k: v for k, v in settings_update.dict().items() if v is not None}
     
@@ -228,35 +324,36 @@ async def update_workout_settings(settings_update: WorkoutSettingsUpdate, user_i
     
     result = await db.workout_settings.update_one(
         {"userId": user_id},
-        {"$set": update_data}
+        {"$set": codec.dump("workout_settings", update_data)}
     )
+    cache.invalidate("settings", user_id)
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Settings not found")
     
     updated_settings = await db.workout_settings.find_one({"userId": user_id})
-    return WorkoutSettings(**updated_settings)
+    return WorkoutSettings(**codec.load("workout_settings", updated_settings))
 
 
 # Workout Session Routes
 @api_router.post("/sessions", response_model=WorkoutSession)
-async def create_workout_session(session_data: WorkoutSessionCreate):
+async def create_workout_session(session_data: WorkoutSessionCreate, db=Depends(get_db), codec: DocumentCodec = Depends(get_codec)):
     """Create a new workout session"""
     session = WorkoutSession(**session_data.dict())
-    await db.workout_sessions.insert_one(session.dict())
+    await db.workout_sessions.insert_one(codec.dump("workout_sessions", session.dict()))
     return session
 
 @api_router.get("/sessions", response_model=List[WorkoutSession])
-async def get_workout_sessions(user_id: str = "default", limit: int = 10):
+async def get_workout_sessions(user_id: str = "default", limit: int = 10, db=Depends(get_db), codec: DocumentCodec = Depends(get_codec)):
     """Get workout sessions for a user"""
     sessions = await db.workout_sessions.find(
         {"userId": user_id}
     ).sort("startedAt", -1).limit(limit).to_list(limit)
     
-    return [WorkoutSession(**session) for session in sessions]
+    return [WorkoutSession(**codec.load("workout_sessions", session)) for session in sessions]
 
 @api_router.put("/sessions/{session_id}/complete")
-async def complete_workout_session(session_id: str, completed_sets: int, completed_circuits: int):
+async def complete_workout_session(session_id: str, completed_sets: int, completed_circuits: int, db=Depends(get_db), codec: DocumentCodec = Depends(get_codec)):
     """Mark a workout session as completed"""
     update_data = {
         "status": "completed",
@@ -266,7 +363,7 @@ async def complete_workout_session(session_id: str, completed_sets: int, complet
     }
     
     # Calculate total duration
-    session = await db.workout_sessions.find_one({"id": session_id})
+    session = await db.workout_sessions.find_one(codec.id_filter(session_id))
     if session:
         start_time = session.get("startedAt")
         if start_time:
@@ -274,7 +371,7 @@ async def complete_workout_session(session_id: str, completed_sets: int, complet
             update_data["totalDuration"] = int(duration)
     
     result = await db.workout_sessions.update_one(
-        {"id": session_id},
+        codec.id_filter(session_id),
         {"$set": update_data}
     )
     
@@ -284,9 +381,17 @@ async def complete_workout_session(session_id: str, completed_sets: int, complet
     return {"message": "Session completed successfully"}
 
 
+@api_router.get("/metrics/sweeper")
+async def get_sweeper_metrics(request: Request, db=Depends(get_db)):
+    """Get metrics of the abandoned session sweeper, summed over all workers"""
+    if not request.app.state.config.sweep_sessions:
+        raise HTTPException(status_code=404, detail="Session sweeper is disabled")
+    return await get_metrics(db)
+
+
 # Statistics Routes
 @api_router.get("/stats")
-async def get_workout_stats(user_id: str = "default"):
+async def get_workout_stats(user_id: str = "default", db=Depends(get_db)):
     """Get workout statistics for a user"""
     pipeline = [
         {"$match": {"userId": user_id, "status": "completed"}},
@@ -316,17 +421,6 @@ async def get_workout_stats(user_id: str = "default"):
     return stats
 
 
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -334,6 +428,94 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+
+def report_task_failure(name: str, on_failure: Optional[Callable[[], None]] = None):
+    """Done-callback logging a background task that stopped with an error"""
+
+    def callback(task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error("%s stopped", name, exc_info=task.exception())
+        if on_failure is not None:
+            on_failure()
+
+    return callback
+
+
+def create_app(config: Optional[AppConfig] = None) -> FastAPI:
+    """Create the API app.
+
+    The MongoDB client is not constructed here but on first use (see
+    Database). Pass ``AppConfig(db=...)`` to use an existing database handle
+    instead.
+    """
+    if config is None:
+        config = AppConfig.from_env()
+    database = Database(config)
+    # Without change streams another worker's writes would go unnoticed, so the
+    # watcher only enables the cache while its stream is open
+    cache = LocalCache(enabled=False)
+
+    async def sweep_sessions(app: FastAPI):
+        # Waiting out the first interval keeps worker boot from opening the client
+        await asyncio.sleep(config.sweep_interval)
+        app.state.sweeper = SessionSweeper(
+            database.get(),
+            max_active_seconds=config.session_abandon_after,
+            interval=config.sweep_interval,
+            batch_size=config.sweep_batch_size,
+            max_run_seconds=config.sweep_max_run_seconds,
+        )
+        await app.state.sweeper.run()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        tasks = []
+        if config.watch_changes:
+            watcher = ChangeStreamWatcher(database.get(), cache)
+            task = asyncio.create_task(watcher.run())
+            task.add_done_callback(report_task_failure("Change stream watcher", on_failure=cache.disable))
+            tasks.append(task)
+        if config.sweep_sessions:
+            task = asyncio.create_task(sweep_sessions(app))
+            task.add_done_callback(report_task_failure("Session sweeper"))
+            tasks.append(task)
+        yield
+        for task in tasks:
+            task.cancel()
+        # Failures were already logged by report_task_failure
+        await asyncio.gather(*tasks, return_exceptions=True)
+        database.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.config = config
+    app.state.database = database
+    app.state.cache = cache
+    app.state.sweeper = None
+    app.state.codec = codec_for_mode(config.storage_mode)
+
+    # Include the router in the main app
+    app.include_router(api_router)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    return app
+
+
+def __getattr__(name: str):
+    """Build the module-level ``app`` (used by ``uvicorn server:app``) on first access.
+
+    Keeping it out of import means ``import server`` does not read the
+    environment or build an app that callers of create_app never use.
+    """
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,138 @@
+"""
+Mapping between the public JSON shape of documents and their stored shape.
+
+In the default ``legacy`` mode documents are stored exactly as the API returns
+them: ids are 36-character UUID strings next to MongoDB's own ObjectId ``_id``.
+
+In ``compact`` mode the document id becomes ``_id`` itself and every UUID
+(including the copies embedded in sessions and ``exerciseOrder``) is stored as
+a 16-byte BSON binary UUID. That drops the ObjectId and the separate ``id``
+field, and makes lookups by id use the ``_id`` index.
+
+Both codecs read documents of either shape, so listing routes keep working
+while ``manage.py migrate-storage`` runs. Lookups by id only match documents in
+the configured shape; see the migration command for the switch-over.
+"""
+
+import uuid
+from typing import Any, Callable, Dict, List
+
+STORAGE_MODES = ("legacy", "compact")
+
+# Dotted paths of UUID-valued fields per collection; lists are walked transparently
+ID_PATHS: Dict[str, List[str]] = {
+    "exercises": ["id"],
+    "workout_settings": ["id", "exerciseOrder"],
+    "workout_sessions": ["id", "exercises.id", "settings.id", "settings.exerciseOrder"],
+    "status_checks": ["id"],
+}
+
+# Secondary indexes, as (collection, keys, options), created in both storage modes by
+# ``manage.py ensure-indexes`` as a deployment step rather than by every worker at boot
+INDEXES = [
+    ("workout_settings", [("userId", 1)], {}),
+    ("workout_sessions", [("userId", 1), ("startedAt", -1)], {}),
+    # Used by the abandoned session sweeper
+    ("workout_sessions", [("startedAt", 1)], {
+        "name": "active_sessions_startedAt",
+        "partialFilterExpression": {"status": "active"},
+    }),
+]
+
+
+def encode_id(value: Any) -> Any:
+    """Encode a canonical UUID string as a binary UUID, leaving anything else untouched"""
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = uuid.UUID(value)
+    except ValueError:
+        return value
+    if str(parsed) != value:
+        # Only canonical strings round-trip exactly
+        return value
+    from bson.binary import Binary
+
+    return Binary.from_uuid(parsed)
+
+
+def decode_id(value: Any) -> Any:
+    """Inverse of encode_id"""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, bytes):
+        # bson's Binary subclasses bytes, so plain string ids never import bson
+        from bson.binary import Binary, UUID_SUBTYPE
+
+        if isinstance(value, Binary) and value.subtype == UUID_SUBTYPE:
+            return str(value.as_uuid())
+    return value
+
+
+def _map_path(doc: Any, parts: List[str], fn: Callable[[Any], Any]) -> Any:
+    """Return a copy of doc with fn applied to the value(s) at the dotted path"""
+    if isinstance(doc, list):
+        return [_map_path(item, parts, fn) for item in doc]
+    if not isinstance(doc, dict) or parts[0] not in doc:
+        return doc
+    value = doc[parts[0]]
+    if len(parts) > 1:
+        value = _map_path(value, parts[1:], fn)
+    elif isinstance(value, list):
+        value = [fn(item) for item in value]
+    else:
+        value = fn(value)
+    return {**doc, parts[0]: value}
+
+
+class DocumentCodec:
+    """Legacy storage: documents are stored as-is"""
+
+    mode = "legacy"
+
+    def dump(self, collection: str, doc: dict) -> dict:
+        """Public (or partial ``$set``) document to stored document"""
+        return doc
+
+    def load(self, collection: str, doc: dict) -> dict:
+        """Stored document (of either shape) to public document"""
+        stored_id = doc.get("_id")
+        # A legacy document keeps its string id; only a compact _id stands in for it
+        if doc.get("id") is None and (isinstance(stored_id, str) or decode_id(stored_id) is not stored_id):
+            doc = dict(doc)
+            doc["id"] = doc.pop("_id")
+        for path in ID_PATHS.get(collection, []):
+            doc = _map_path(doc, path.split("."), decode_id)
+        return doc
+
+    def id_filter(self, value: str) -> dict:
+        """Query matching the document with the given public id"""
+        return {"id": value}
+
+
+class CompactCodec(DocumentCodec):
+    """Compact storage: binary UUIDs, with the public id stored as ``_id``"""
+
+    mode = "compact"
+
+    def dump(self, collection: str, doc: dict) -> dict:
+        for path in ID_PATHS.get(collection, []):
+            doc = _map_path(doc, path.split("."), encode_id)
+        if "id" in doc:
+            doc = dict(doc)
+            doc["_id"] = doc.pop("id")
+        return doc
+
+    def id_filter(self, value: str) -> dict:
+        return {"_id": encode_id(value)}
+
+
+def codec_for_mode(mode: str) -> DocumentCodec:
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode {mode!r}, expected one of {', '.join(STORAGE_MODES)}")
+    return CompactCodec() if mode == "compact" else DocumentCodec()
+
+
+async def ensure_indexes(db):
+    for collection, keys, options in INDEXES:
+        await db[collection].create_index(keys, **options)
@@ -0,0 +1,120 @@
+"""
+Background sweeper marking workout sessions that were never completed as abandoned.
+
+A session still ``active`` after ``max_active_seconds`` is swept. Each batch is
+a lookup on the partial index of active sessions (see storage.INDEXES)
+followed by one ``update_many`` on the matched ``_id`` values, and each run
+stops after ``max_run_seconds`` so a large backlog is worked off over several
+runs.
+
+Every worker runs a sweeper, but only the holder of a lease document in
+``background_tasks`` sweeps; the others take over once it expires. The same
+document carries the counters, so they add up across workers and restarts.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+STATE_COLLECTION = "background_tasks"
+SWEEPER_ID = "session_sweeper"
+
+
+class SessionSweeper:
+    def __init__(self, db, max_active_seconds: int, interval: float, batch_size: int, max_run_seconds: float):
+        self.db = db
+        self.max_active_seconds = max_active_seconds
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_run_seconds = max_run_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        # Long enough to survive one missed run, short enough to hand over quickly
+        self.lease_seconds = 2 * interval + max_run_seconds
+
+    async def acquire_lease(self) -> bool:
+        """Take or renew the lease; False while another worker holds it"""
+        from pymongo.errors import DuplicateKeyError
+
+        now = datetime.utcnow()
+        try:
+            await self.db[STATE_COLLECTION].find_one_and_update(
+                {"_id": SWEEPER_ID, "$or": [{"leaseExpiresAt": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "leaseExpiresAt": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The document exists but did not match: someone else holds a live lease
+            return False
+        return True
+
+    async def sweep_once(self) -> int:
+        """Mark stale active sessions as abandoned; returns how many were swept"""
+        started = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.max_active_seconds)
+        stale = {"status": "active", "startedAt": {"$lt": cutoff}}
+        swept = 0
+        truncated = False
+
+        while True:
+            batch = await self.db.workout_sessions.find(stale, {"_id": 1}).limit(self.batch_size).to_list(self.batch_size)
+            if not batch:
+                break
+            result = await self.db.workout_sessions.update_many(
+                {"_id": {"$in": [doc["_id"] for doc in batch]}, "status": "active"},
+                {"$set": {"status": "abandoned"}}
+            )
+            swept += result.modified_count
+            if len(batch) < self.batch_size:
+                break
+            if time.monotonic() - started >= self.max_run_seconds:
+                truncated = True
+                break
+
+        await self.db[STATE_COLLECTION].update_one(
+            {"_id": SWEEPER_ID},
+            {
+                "$inc": {"runs": 1, "sweptTotal": swept},
+                "$set": {
+                    "lastSwept": swept,
+                    "lastRunAt": datetime.utcnow(),
+                    "lastRunDuration": time.monotonic() - started,
+                    "lastRunTruncated": truncated,
+                    "lastRunBy": self.owner,
+                },
+            },
+            upsert=True
+        )
+        if swept:
+            logger.info("Marked %d stale sessions as abandoned%s", swept, " (run truncated)" if truncated else "")
+        return swept
+
+    async def run(self):
+        from pymongo.errors import PyMongoError
+
+        while True:
+            try:
+                if await self.acquire_lease():
+                    await self.sweep_once()
+            except PyMongoError as e:
+                logger.warning("Session sweep failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+
+async def get_metrics(db) -> dict:
+    """Counters of all sweeps so far, whichever worker ran them"""
+    state = await db[STATE_COLLECTION].find_one({"_id": SWEEPER_ID}) or {}
+    return {
+        "runs": state.get("runs", 0),
+        "sweptTotal": state.get("sweptTotal", 0),
+        "lastSwept": state.get("lastSwept", 0),
+        "lastRunAt": state.get("lastRunAt"),
+        "lastRunDuration": state.get("lastRunDuration", 0.0),
+        "lastRunTruncated": state.get("lastRunTruncated", False),
+        "lastRunBy": state.get("lastRunBy"),
+        "leaseOwner": state.get("owner"),
+    }
@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend runs from its own directory (uvicorn server:app), so import it the same way
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from tests.fake_mongo import FakeDatabase  # noqa: E402
+
+
+@pytest.fixture
+def fake_db():
+    return FakeDatabase()
@@ -0,0 +1,241 @@
+"""
+In-memory stand-in for the parts of the Motor API the backend uses, so routes
+and background tasks can be exercised without a MongoDB server.
+"""
+
+import asyncio
+import copy
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+
+def _get(doc, path):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None, False
+        value = value[part]
+    return value, True
+
+
+def _match_value(value, present, condition):
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if present != bool(arg):
+                    return False
+            elif op == "$in":
+                if not present or value not in arg:
+                    return False
+            elif op == "$nin":
+                if present and value in arg:
+                    return False
+            elif op == "$lt":
+                if not present or value is None or not value < arg:
+                    return False
+            else:
+                raise NotImplementedError(op)
+        return True
+    return present and value == condition
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_value(*_get(doc, key), condition):
+            return False
+    return True
+
+
+def apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            doc.update(copy.deepcopy(fields))
+        elif op == "$inc":
+            for key, amount in fields.items():
+                doc[key] = doc.get(key, 0) + amount
+        elif op != "$setOnInsert":
+            raise NotImplementedError(op)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        self.docs.sort(key=lambda doc: doc.get(key), reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length):
+        return self.docs[:length] if length else self.docs
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.docs = []
+        self.indexes = []
+        self.calls = {}
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _insert(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        if any(existing["_id"] == doc["_id"] for existing in self.docs):
+            raise DuplicateKeyError("E11000 duplicate key error", 11000)
+        self.docs.append(doc)
+        return doc
+
+    async def insert_one(self, doc):
+        self._count("insert_one")
+        return SimpleNamespace(inserted_id=self._insert(doc)["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        self._count("insert_many")
+        return SimpleNamespace(inserted_ids=[self._insert(doc)["_id"] for doc in docs])
+
+    def find(self, query=None, projection=None):
+        self._count("find")
+        found = [copy.deepcopy(doc) for doc in self.docs if matches(doc, query)]
+        if projection:
+            keep = {key for key, on in projection.items() if on} | {"_id"}
+            found = [{key: value for key, value in doc.items() if key in keep} for doc in found]
+        return FakeCursor(found)
+
+    async def find_one(self, query=None):
+        self._count("find_one")
+        docs = await self.find(query).to_list(1)
+        return docs[0] if docs else None
+
+    async def update_one(self, query, update, upsert=False):
+        self._count("update_one")
+        for doc in self.docs:
+            if matches(doc, query):
+                apply_update(doc, update)
+                return SimpleNamespace(matched_count=1, modified_count=1)
+        if upsert:
+            doc = {key: value for key, value in query.items() if not key.startswith("$")}
+            apply_update(doc, update, inserting=True)
+            self._insert(doc)
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    async def update_many(self, query, update):
+        self._count("update_many")
+        matched = [doc for doc in self.docs if matches(doc, query)]
+        for doc in matched:
+            apply_update(doc, update)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=False):
+        self._count("find_one_and_update")
+        for doc in self.docs:
+            if matches(doc, query):
+                before = copy.deepcopy(doc)
+                apply_update(doc, update)
+                return copy.deepcopy(doc) if return_document else before
+        if upsert:
+            doc = {key: value for key, value in query.items() if not key.startswith("$")}
+            apply_update(doc, update, inserting=True)
+            inserted = self._insert(doc)
+            return copy.deepcopy(inserted) if return_document else None
+        return None
+
+    async def bulk_write(self, requests, ordered=True):
+        """Only ReplaceOne is supported"""
+        self._count("bulk_write")
+        matched = upserted = 0
+        for request in requests:
+            for n, doc in enumerate(self.docs):
+                if matches(doc, request._filter):
+                    self.docs[n] = {"_id": doc["_id"], **copy.deepcopy(request._doc)}
+                    matched += 1
+                    break
+            else:
+                if request._upsert:
+                    self._insert(request._doc)
+                    upserted += 1
+        return SimpleNamespace(matched_count=matched, upserted_count=upserted)
+
+    async def delete_one(self, query):
+        self._count("delete_one")
+        for doc in self.docs:
+            if matches(doc, query):
+                self.docs.remove(doc)
+                return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    async def delete_many(self, query):
+        self._count("delete_many")
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def create_index(self, keys, **options):
+        self._count("create_index")
+        if isinstance(keys, str):
+            keys = [(keys, 1)]
+        self.indexes.append((keys, options))
+        return options.get("name", "_".join(f"{key}_{direction}" for key, direction in keys))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+        self.streams = []
+        self.watch_calls = []
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name)
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def watch(self, pipeline=None, **kwargs):
+        """Hands out the queued FakeChangeStreams in order, then idle streams"""
+        self.watch_calls.append(kwargs)
+        return self.streams.pop(0) if self.streams else FakeChangeStream()
+
+
+class FakeChangeStream:
+    """Yields the given events, then raises ``error`` or waits until cancelled"""
+
+    def __init__(self, events=(), error=None, open_error=None):
+        self.events = list(events)
+        self.error = error
+        self.open_error = open_error
+        self.resume_token = None
+
+    async def __aenter__(self):
+        if self.open_error is not None:
+            raise self.open_error
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.events:
+            change = self.events.pop(0)
+            self.resume_token = change["_id"]
+            return change
+        if self.error is not None:
+            raise self.error
+        await asyncio.Event().wait()
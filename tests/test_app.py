@@ -0,0 +1,62 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from server import AppConfig, Database, create_app, get_db
+from tests.fake_mongo import FakeDatabase
+
+
+def test_create_app_uses_injected_db(fake_db):
+    with TestClient(create_app(AppConfig(db=fake_db))) as client:
+        response = client.get("/api/exercises")
+
+    assert response.status_code == 200
+    names = [exercise["name"] for exercise in response.json()]
+    assert names == ["Push-ups", "Squats", "Jumping Jacks", "Mountain Climbers"]
+    assert [doc["name"] for doc in fake_db.exercises.docs] == names
+
+
+def test_get_db_can_be_overridden(fake_db):
+    other_db = FakeDatabase()
+    app = create_app(AppConfig(db=fake_db))
+    app.dependency_overrides[get_db] = lambda: other_db
+
+    with TestClient(app) as client:
+        client.post("/api/exercises", json={"name": "Burpees", "description": "Explosive"})
+
+    assert fake_db.exercises.docs == []
+    assert [doc["name"] for doc in other_db.exercises.docs] == ["Burpees"]
+
+
+def test_apps_do_not_share_state():
+    first, second = FakeDatabase(), FakeDatabase()
+    with TestClient(create_app(AppConfig(db=first))) as client:
+        client.post("/api/status", json={"client_name": "first"})
+    with TestClient(create_app(AppConfig(db=second))) as client:
+        assert client.get("/api/status").json() == []
+
+    assert len(first.status_checks.docs) == 1
+
+
+def test_database_client_is_built_on_first_use():
+    database = Database(AppConfig(mongo_url="mongodb://localhost:27017", db_name="hiit_test"))
+    assert database.client is None
+
+    db = database.get()
+    assert database.client is not None
+    assert db.name == "hiit_test"
+    assert database.get() is db
+
+    database.close()
+    assert database.client is None
+
+
+def test_database_requires_configuration():
+    with pytest.raises(RuntimeError, match="MONGO_URL and DB_NAME"):
+        Database(AppConfig()).get()
+
+
+def test_startup_and_routes_without_db_do_not_open_a_client():
+    app = create_app(AppConfig(mongo_url="mongodb://localhost:27017", db_name="hiit_test", sweep_sessions=True))
+    with TestClient(app) as client:
+        assert client.get("/api/").json()["message"] == "Exercise Timer API"
+        assert app.state.database.client is None
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from cache import ChangeStreamWatcher, LocalCache
+from server import AppConfig, create_app
+from tests.fake_mongo import FakeChangeStream
+
+
+def change(n, operation, collection, document=None):
+    event = {"_id": {"_data": f"token-{n}"}, "operationType": operation, "ns": {"db": "hiit", "coll": collection}}
+    if document is not None:
+        event["fullDocument"] = document
+    return event
+
+
+async def run_watcher(watcher, until, timeout=2.0):
+    """Run the watcher until ``until()`` holds, then cancel it"""
+    task = asyncio.create_task(watcher.run())
+    deadline = time.monotonic() + timeout
+    while not until() and not task.done() and time.monotonic() < deadline:
+        await asyncio.sleep(0.001)
+    assert until(), "watcher did not reach the expected state"
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return task
+
+
+# LocalCache
+
+def test_cache_set_get_and_invalidate_key():
+    cache = LocalCache()
+    cache.set("settings", "alice", "a", cache.version("settings"))
+    cache.set("settings", "bob", "b", cache.version("settings"))
+
+    cache.invalidate("settings", "alice")
+
+    assert cache.get("settings", "alice") is None
+    assert cache.get("settings", "bob") == "b"
+
+
+def test_cache_invalidate_namespace():
+    cache = LocalCache()
+    cache.set("settings", "alice", "a", cache.version("settings"))
+    cache.set("exercises", "all", ["x"], cache.version("exercises"))
+
+    cache.invalidate("settings")
+
+    assert cache.get("settings", "alice") is None
+    assert cache.get("exercises", "all") == ["x"]
+
+
+def test_cache_drops_values_read_before_invalidation():
+    cache = LocalCache()
+    version = cache.version("exercises")
+    cache.invalidate("exercises")
+
+    cache.set("exercises", "all", ["stale"], version)
+
+    assert cache.get("exercises", "all") is None
+
+
+def test_disabled_cache_neither_serves_nor_stores():
+    cache = LocalCache(enabled=False)
+    cache.set("exercises", "all", ["x"], cache.version("exercises"))
+    assert cache.get("exercises", "all") is None
+
+    cache = LocalCache()
+    cache.set("exercises", "all", ["x"], cache.version("exercises"))
+    cache.disable()
+    assert cache.get("exercises", "all") is None
+
+
+def test_enable_drops_reads_started_while_disabled():
+    cache = LocalCache(enabled=False)
+    version = cache.version("exercises")
+
+    cache.enable()
+    cache.set("exercises", "all", ["read before the stream opened"], version)
+
+    assert cache.get("exercises", "all") is None
+
+
+# ChangeStreamWatcher.apply
+
+def test_apply_exercise_change_invalidates_exercises(fake_db):
+    cache = LocalCache()
+    cache.set("exercises", "all", ["x"], cache.version("exercises"))
+    cache.set("settings", "alice", "a", cache.version("settings"))
+
+    ChangeStreamWatcher(fake_db, cache).apply(change(1, "insert", "exercises", {"name": "Burpees"}))
+
+    assert cache.get("exercises", "all") is None
+    assert cache.get("settings", "alice") == "a"
+
+
+def test_apply_settings_update_invalidates_only_that_user(fake_db):
+    cache = LocalCache()
+    cache.set("settings", "alice", "a", cache.version("settings"))
+    cache.set("settings", "bob", "b", cache.version("settings"))
+
+    ChangeStreamWatcher(fake_db, cache).apply(change(1, "update", "workout_settings", {"userId": "alice"}))
+
+    assert cache.get("settings", "alice") is None
+    assert cache.get("settings", "bob") == "b"
+
+
+def test_apply_settings_delete_invalidates_all_settings(fake_db):
+    cache = LocalCache()
+    cache.set("settings", "alice", "a", cache.version("settings"))
+    cache.set("settings", "bob", "b", cache.version("settings"))
+
+    ChangeStreamWatcher(fake_db, cache).apply(change(1, "delete", "workout_settings"))
+
+    assert cache.get("settings", "alice") is None
+    assert cache.get("settings", "bob") is None
+
+
+def test_apply_drop_database_clears_everything(fake_db):
+    cache = LocalCache()
+    cache.set("exercises", "all", ["x"], cache.version("exercises"))
+
+    ChangeStreamWatcher(fake_db, cache).apply({"_id": {}, "operationType": "dropDatabase", "ns": {"db": "hiit"}})
+
+    assert cache.get("exercises", "all") is None
+
+
+# ChangeStreamWatcher.run
+
+def test_cache_is_enabled_only_once_the_stream_is_open(fake_db):
+    cache = LocalCache(enabled=False)
+    fake_db.streams.append(FakeChangeStream(open_error=AutoReconnect("connection refused")))
+    fake_db.streams.append(FakeChangeStream())
+    watcher = ChangeStreamWatcher(fake_db, cache, retry_delay=0)
+
+    async def scenario():
+        seen_while_failing = []
+        original_disable = cache.disable
+
+        def disable():
+            original_disable()
+            seen_while_failing.append(cache.enabled)
+
+        cache.disable = disable
+        await run_watcher(watcher, lambda: cache.enabled)
+        return seen_while_failing
+
+    seen_while_failing = asyncio.run(scenario())
+
+    assert seen_while_failing[0] is False
+    assert len(fake_db.watch_calls) == 2
+    # Cancelling the watcher switches the cache off again
+    assert cache.enabled is False
+
+
+def test_stream_error_disables_and_clears_cache(fake_db):
+    cache = LocalCache(enabled=False)
+    fake_db.streams.append(FakeChangeStream(error=AutoReconnect("primary stepped down")))
+    watcher = ChangeStreamWatcher(fake_db, cache, retry_delay=0.5)
+
+    async def scenario():
+        task = asyncio.create_task(watcher.run())
+        while not fake_db.watch_calls:
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(0.01)
+        state = cache.enabled
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return state
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_not_a_replica_set_leaves_caching_disabled(fake_db):
+    cache = LocalCache(enabled=False)
+    fake_db.streams.append(FakeChangeStream(
+        open_error=OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+    ))
+    watcher = ChangeStreamWatcher(fake_db, cache, retry_delay=0)
+
+    asyncio.run(asyncio.wait_for(watcher.run(), timeout=1))
+
+    assert cache.enabled is False
+    assert len(fake_db.watch_calls) == 1
+
+
+def test_reconnect_starts_a_fresh_stream_on_an_empty_cache(fake_db):
+    cache = LocalCache(enabled=False)
+    fake_db.streams.append(FakeChangeStream(error=AutoReconnect("primary stepped down")))
+    watcher = ChangeStreamWatcher(fake_db, cache, retry_delay=0)
+
+    async def scenario():
+        seen = []
+        original_enable = cache.enable
+
+        def enable():
+            original_enable()
+            # What the previous stream left behind, if anything
+            seen.append(cache.get("exercises", "all"))
+            cache.set("exercises", "all", ["x"], cache.version("exercises"))
+
+        cache.enable = enable
+        await run_watcher(watcher, lambda: len(seen) == 2)
+        return seen
+
+    assert asyncio.run(scenario()) == [None, None]
+    assert len(fake_db.watch_calls) == 2
+    assert all("resume_after" not in call for call in fake_db.watch_calls)
+
+
+# Lifespan
+
+def test_crashed_watcher_disables_cache_and_shutdown_survives(fake_db, caplog):
+    fake_db.streams.append(FakeChangeStream(open_error=RuntimeError("boom")))
+    app = create_app(AppConfig(db=fake_db, watch_changes=True))
+
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 2
+        while "Change stream watcher stopped" not in caplog.text and time.monotonic() < deadline:
+            time.sleep(0.01)
+        client.get("/api/exercises")
+        client.get("/api/exercises")
+
+    assert "Change stream watcher stopped" in caplog.text
+    assert app.state.cache.enabled is False
+    # Every request went to the database
+    assert fake_db.exercises.calls["find"] == 2
+
+
+@pytest.mark.skipif(not os.environ.get("MONGO_REPLSET_URL"), reason="needs MONGO_REPLSET_URL of a replica set")
+def test_write_on_one_worker_invalidates_the_other():
+    """Two apps on a real (single-node) replica set stand in for two uvicorn workers"""
+    db_name = f"hiit_test_{uuid.uuid4().hex[:8]}"
+    url = os.environ["MONGO_REPLSET_URL"]
+    writer = create_app(AppConfig(mongo_url=url, db_name=db_name, watch_changes=True))
+    reader = create_app(AppConfig(mongo_url=url, db_name=db_name, watch_changes=True))
+
+    try:
+        with TestClient(writer) as writer_client, TestClient(reader) as reader_client:
+            deadline = time.monotonic() + 10
+            while not reader.state.cache.enabled and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert reader.state.cache.enabled
+
+            before = reader_client.get("/api/exercises").json()
+            assert reader.state.cache.get("exercises", "all") is not None
+
+            writer_client.post("/api/exercises", json={"name": "Burpees", "description": "Explosive"})
+
+            names = [exercise["name"] for exercise in before]
+            while "Burpees" not in names and time.monotonic() < deadline:
+                time.sleep(0.05)
+                names = [exercise["name"] for exercise in reader_client.get("/api/exercises").json()]
+            assert "Burpees" in names
+    finally:
+        from pymongo import MongoClient
+
+        MongoClient(url).drop_database(db_name)
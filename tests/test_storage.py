@@ -0,0 +1,186 @@
+import asyncio
+import subprocess
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+from bson import ObjectId
+from bson.binary import Binary, UUID_SUBTYPE
+from fastapi.testclient import TestClient
+
+from manage import migrate_collection, seed_documents
+from server import AppConfig, create_app
+from storage import CompactCodec, DocumentCodec, codec_for_mode, ensure_indexes
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+@pytest.mark.parametrize("collection", ["exercises", "workout_settings", "workout_sessions"])
+def test_compact_round_trip(collection):
+    codec = CompactCodec()
+    for doc in seed_documents(users=2, sessions_per_user=2)[collection]:
+        assert codec.load(collection, codec.dump(collection, doc)) == doc
+
+
+def test_compact_dump_stores_binary_uuids_under_id():
+    session = seed_documents(users=1, sessions_per_user=1)["workout_sessions"][0]
+
+    stored = CompactCodec().dump("workout_sessions", session)
+
+    assert "id" not in stored
+    assert stored["_id"] == Binary.from_uuid(uuid.UUID(session["id"]))
+    assert stored["_id"].subtype == UUID_SUBTYPE
+    assert all(isinstance(exercise["id"], Binary) for exercise in stored["exercises"])
+    assert isinstance(stored["settings"]["id"], Binary)
+    assert all(isinstance(value, Binary) for value in stored["settings"]["exerciseOrder"])
+    # The caller's document is left alone
+    assert isinstance(session["exercises"][0]["id"], str)
+
+
+@pytest.mark.parametrize("value", [
+    "non-existent-id",
+    "6F9619FF-8B86-D011-B42D-00C04FC964FF",
+    "6f9619ff8b86d011b42d00c04fc964ff",
+    "{6f9619ff-8b86-d011-b42d-00c04fc964ff}",
+])
+def test_non_canonical_ids_are_kept_as_strings(value):
+    codec = CompactCodec()
+    doc = {"id": value, "name": "Squats", "description": "Bodyweight squats", "isActive": True}
+
+    stored = codec.dump("exercises", doc)
+
+    assert stored["_id"] == value
+    assert codec.load("exercises", stored) == doc
+    assert codec.id_filter(value) == {"_id": value}
+
+
+def test_set_partial_encodes_ids_without_adding_an_id():
+    order = [str(uuid.uuid4()), str(uuid.uuid4())]
+
+    stored = CompactCodec().dump("workout_settings", {"exerciseOrder": order, "workTime": 30})
+
+    assert set(stored) == {"exerciseOrder", "workTime"}
+    assert stored["exerciseOrder"] == [Binary.from_uuid(uuid.UUID(value)) for value in order]
+    assert stored["workTime"] == 30
+
+
+def test_id_filters():
+    value = str(uuid.uuid4())
+    assert DocumentCodec().id_filter(value) == {"id": value}
+    assert CompactCodec().id_filter(value) == {"_id": Binary.from_uuid(uuid.UUID(value))}
+
+
+@pytest.mark.parametrize("codec", [DocumentCodec(), CompactCodec()], ids=["legacy", "compact"])
+def test_load_accepts_both_shapes(codec):
+    exercise = seed_documents(users=1, sessions_per_user=0)["exercises"][0]
+    legacy_doc = {"_id": ObjectId(), **exercise}
+    compact_doc = CompactCodec().dump("exercises", exercise)
+
+    assert codec.load("exercises", legacy_doc)["id"] == exercise["id"]
+    assert codec.load("exercises", compact_doc)["id"] == exercise["id"]
+
+
+def test_codec_for_mode():
+    assert isinstance(codec_for_mode("compact"), CompactCodec)
+    assert type(codec_for_mode("legacy")) is DocumentCodec
+    with pytest.raises(ValueError):
+        codec_for_mode("tiny")
+
+
+def test_compact_mode_api(fake_db):
+    with TestClient(create_app(AppConfig(db=fake_db, storage_mode="compact"))) as client:
+        exercises = client.get("/api/exercises").json()
+        exercise_id = exercises[0]["id"]
+
+        updated = client.put(f"/api/exercises/{exercise_id}", json={"name": "Wide push-ups"})
+        assert updated.json() == {**exercises[0], "name": "Wide push-ups"}
+        assert client.put("/api/exercises/non-existent-id", json={"name": "x"}).status_code == 404
+
+        client.get("/api/settings")
+        order = [exercise["id"] for exercise in exercises]
+        assert client.put("/api/settings", json={"exerciseOrder": order}).json()["exerciseOrder"] == order
+
+        session = client.post("/api/sessions", json={"exercises": exercises, "settings": client.get("/api/settings").json()}).json()
+        assert client.get("/api/sessions").json()[0]["id"] == session["id"]
+        assert client.put(f"/api/sessions/{session['id']}/complete?completed_sets=3&completed_circuits=2").status_code == 200
+
+    stored = fake_db.exercises.docs[0]
+    assert stored["_id"] == Binary.from_uuid(uuid.UUID(exercise_id))
+    assert "id" not in stored
+    assert fake_db.workout_sessions.docs[0]["status"] == "completed"
+
+
+def test_migration_keeps_public_documents(fake_db):
+    documents = seed_documents(users=2, sessions_per_user=3)
+    for collection, docs in documents.items():
+        for doc in docs:
+            fake_db[collection].docs.append({"_id": ObjectId(), **doc})
+
+    for collection in documents:
+        result = asyncio.run(migrate_collection(fake_db, collection, batch_size=4))
+        assert result == {"migrated": len(documents[collection]), "duplicates": []}
+
+    codec = CompactCodec()
+    for collection, docs in documents.items():
+        stored = fake_db[collection].docs
+        assert all("id" not in doc for doc in stored)
+        assert sorted((codec.load(collection, doc) for doc in stored), key=lambda doc: doc["id"]) == \
+            sorted(docs, key=lambda doc: doc["id"])
+
+
+def test_rerun_migration_keeps_updates_made_after_an_interrupted_run(fake_db):
+    exercise = seed_documents(users=1, sessions_per_user=0)["exercises"][0]
+    # An interrupted run wrote the compact copy but never deleted the original,
+    # which a legacy worker has updated since
+    fake_db.exercises.docs.append(CompactCodec().dump("exercises", exercise))
+    fake_db.exercises.docs.append({"_id": ObjectId(), **exercise, "name": "Wide push-ups"})
+
+    result = asyncio.run(migrate_collection(fake_db, "exercises", batch_size=10))
+
+    assert result == {"migrated": 1, "duplicates": []}
+    assert [CompactCodec().load("exercises", doc) for doc in fake_db.exercises.docs] == \
+        [{**exercise, "name": "Wide push-ups"}]
+
+
+def test_migration_reports_ids_stored_twice(fake_db):
+    exercise = seed_documents(users=1, sessions_per_user=0)["exercises"][0]
+    first, second = ObjectId(), ObjectId()
+    fake_db.exercises.docs.append({"_id": first, **exercise})
+    fake_db.exercises.docs.append({"_id": second, **exercise, "name": "Wide push-ups"})
+
+    result = asyncio.run(migrate_collection(fake_db, "exercises", batch_size=1))
+
+    assert result == {"migrated": 1, "duplicates": [second]}
+    # The second copy is left alone rather than overwriting or being deleted
+    assert [doc["_id"] for doc in fake_db.exercises.docs] == [second, CompactCodec().id_filter(exercise["id"])["_id"]]
+    assert fake_db.exercises.docs[0]["name"] == "Wide push-ups"
+
+
+def test_listing_works_with_mixed_documents(fake_db):
+    exercises = seed_documents(users=1, sessions_per_user=0)["exercises"]
+    fake_db.exercises.docs.append({"_id": ObjectId(), **exercises[0]})
+    fake_db.exercises.docs.append(CompactCodec().dump("exercises", exercises[1]))
+
+    for mode in ("legacy", "compact"):
+        with TestClient(create_app(AppConfig(db=fake_db, storage_mode=mode))) as client:
+            assert client.get("/api/exercises").json() == exercises[:2]
+
+
+def test_server_import_does_not_load_mongo_packages():
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import server, sys; print(sorted({'bson', 'pymongo', 'motor'} & set(sys.modules)))"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert loaded == "[]"
+
+
+def test_indexes_are_left_to_the_deploy_step(fake_db):
+    with TestClient(create_app(AppConfig(db=fake_db, storage_mode="compact", sweep_sessions=True))):
+        pass
+    assert fake_db.workout_sessions.indexes == []
+
+    asyncio.run(ensure_indexes(fake_db))
+
+    assert [keys for keys, _ in fake_db.workout_settings.indexes] == [[("userId", 1)]]
+    assert [keys for keys, _ in fake_db.workout_sessions.indexes] == [[("userId", 1), ("startedAt", -1)], [("startedAt", 1)]]
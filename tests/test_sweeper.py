@@ -0,0 +1,139 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from server import AppConfig, create_app
+from sweeper import STATE_COLLECTION, SessionSweeper, get_metrics
+
+HOUR = 60 * 60
+
+
+def add_sessions(db, count, age_hours, status="active"):
+    start = len(db.workout_sessions.docs)
+    for n in range(start, start + count):
+        db.workout_sessions.docs.append({
+            "_id": n,
+            "id": f"session-{n}",
+            "status": status,
+            "startedAt": datetime.utcnow() - timedelta(hours=age_hours),
+        })
+
+
+def statuses(db):
+    return [doc["status"] for doc in db.workout_sessions.docs]
+
+
+def make_sweeper(db, **overrides):
+    options = dict(max_active_seconds=4 * HOUR, interval=300, batch_size=500, max_run_seconds=10)
+    options.update(overrides)
+    return SessionSweeper(db, **options)
+
+
+def test_sweeps_only_sessions_active_past_the_cutoff(fake_db):
+    add_sessions(fake_db, 2, age_hours=5)
+    add_sessions(fake_db, 2, age_hours=1)
+    add_sessions(fake_db, 1, age_hours=5, status="completed")
+
+    swept = asyncio.run(make_sweeper(fake_db).sweep_once())
+
+    assert swept == 2
+    assert statuses(fake_db) == ["abandoned", "abandoned", "active", "active", "completed"]
+
+
+def test_sweeps_in_batches_with_one_update_many_each(fake_db):
+    add_sessions(fake_db, 7, age_hours=5)
+
+    swept = asyncio.run(make_sweeper(fake_db, batch_size=3).sweep_once())
+
+    assert swept == 7
+    assert fake_db.workout_sessions.calls["update_many"] == 3
+    assert set(statuses(fake_db)) == {"abandoned"}
+
+
+def test_run_stops_at_max_run_seconds_and_flags_truncation(fake_db):
+    add_sessions(fake_db, 7, age_hours=5)
+    sweeper = make_sweeper(fake_db, batch_size=3, max_run_seconds=0)
+
+    assert asyncio.run(sweeper.sweep_once()) == 3
+    assert asyncio.run(get_metrics(fake_db))["lastRunTruncated"] is True
+
+    # The next runs pick up the rest
+    assert asyncio.run(sweeper.sweep_once()) == 3
+    assert asyncio.run(sweeper.sweep_once()) == 1
+    metrics = asyncio.run(get_metrics(fake_db))
+    assert metrics["lastRunTruncated"] is False
+    assert metrics["runs"] == 3
+    assert metrics["sweptTotal"] == 7
+
+
+def test_counters_add_up_across_workers(fake_db):
+    add_sessions(fake_db, 2, age_hours=5)
+    asyncio.run(make_sweeper(fake_db).sweep_once())
+    add_sessions(fake_db, 3, age_hours=5)
+    asyncio.run(make_sweeper(fake_db).sweep_once())
+
+    metrics = asyncio.run(get_metrics(fake_db))
+    assert metrics["runs"] == 2
+    assert metrics["sweptTotal"] == 5
+    assert metrics["lastSwept"] == 3
+
+
+def test_only_one_worker_holds_the_lease(fake_db):
+    first, second = make_sweeper(fake_db), make_sweeper(fake_db)
+    second.owner = "other-host:1"
+
+    assert asyncio.run(first.acquire_lease()) is True
+    assert asyncio.run(second.acquire_lease()) is False
+    # The holder renews its own lease
+    assert asyncio.run(first.acquire_lease()) is True
+
+    fake_db[STATE_COLLECTION].docs[0]["leaseExpiresAt"] = datetime.utcnow() - timedelta(seconds=1)
+    assert asyncio.run(second.acquire_lease()) is True
+    assert asyncio.run(first.acquire_lease()) is False
+
+
+def test_metrics_endpoint_reports_shared_counters(fake_db):
+    add_sessions(fake_db, 4, age_hours=5)
+    config = AppConfig(db=fake_db, sweep_sessions=True, sweep_interval=0.01)
+
+    with TestClient(create_app(config)) as client:
+        deadline = time.monotonic() + 2
+        while not fake_db[STATE_COLLECTION].docs or "runs" not in fake_db[STATE_COLLECTION].docs[0]:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        metrics = client.get("/api/metrics/sweeper").json()
+
+    assert metrics["runs"] >= 1
+    assert metrics["sweptTotal"] == 4
+    assert metrics["leaseOwner"] == metrics["lastRunBy"]
+
+
+def test_metrics_endpoint_when_disabled(fake_db):
+    with TestClient(create_app(AppConfig(db=fake_db))) as client:
+        assert client.get("/api/metrics/sweeper").status_code == 404
+
+
+def test_first_sweep_waits_one_interval(fake_db):
+    add_sessions(fake_db, 1, age_hours=5)
+
+    with TestClient(create_app(AppConfig(db=fake_db, sweep_sessions=True, sweep_interval=3600))) as client:
+        assert client.get("/api/metrics/sweeper").json()["runs"] == 0
+
+    assert statuses(fake_db) == ["active"]
+
+
+def test_crashed_sweeper_is_logged_and_shutdown_survives(fake_db, caplog):
+    async def boom(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    fake_db[STATE_COLLECTION].find_one_and_update = boom
+
+    with TestClient(create_app(AppConfig(db=fake_db, sweep_sessions=True, sweep_interval=0.01))):
+        deadline = time.monotonic() + 2
+        while "Session sweeper stopped" not in caplog.text and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert "Session sweeper stopped" in caplog.text
+    assert fake_db[STATE_COLLECTION].docs == []